@@ -0,0 +1,309 @@
+import argparse
+import multiprocessing
+import time
+import numpy as np
+
+from multiprocessing import connection, shared_memory
+
+from micwave.src import yee
+from micwave.src.microwave_oven import MicrowaveOven, STEADY_PROBE
+from micwave.util.config import cfg
+
+FIELDS = ["E", "H", "max_E"]
+COEFS = ["caE", "cbE", "daH", "dbH"]
+
+
+class SlabDecomposition:
+    """Partition of the grid in slabs along x, one per worker. Each slab owns
+    the x-indices [start, stop) of every field component and also stores one
+    halo plane on each side, which holds a copy of its neighbours' values."""
+
+    def __init__(self, shape, n_parts):
+        self.shape = shape  # (Nx, Ny, Nz) cells of the whole grid
+        self.n_parts = n_parts
+        Nx = shape[0]
+        if Nx + 1 < 2 * n_parts:
+            raise ValueError(f"Cannot split {Nx} cells in {n_parts} slabs")
+        # Owned ranges, over the Nx + 1 nodes of the staggered components
+        self.bounds = np.linspace(0, Nx + 1, n_parts + 1).round().astype(int)
+
+    def owned(self, part):
+        return (int(self.bounds[part]), int(self.bounds[part + 1]))
+
+    def extent(self, part):
+        """x-range stored by a slab, halos included."""
+        start, stop = self.owned(part)
+        return (max(start - 1, 0), min(stop + 1, self.shape[0] + 1))
+
+    def global_shapes(self):
+        Nx, Ny, Nz = self.shape
+        shapes = {
+            "E_x": (Nx, Ny + 1, Nz + 1),
+            "E_y": (Nx + 1, Ny, Nz + 1),
+            "E_z": (Nx + 1, Ny + 1, Nz),
+            "H_x": (Nx + 1, Ny, Nz),
+            "H_y": (Nx, Ny + 1, Nz),
+            "H_z": (Nx, Ny, Nz + 1),
+        }
+        for k in "xyz":
+            shapes["max_E_" + k] = shapes["E_" + k]
+        for c in COEFS:
+            shapes[c] = (Nx, Ny, Nz)
+        return shapes
+
+    def local_shapes(self, part):
+        lo, hi = self.extent(part)
+        return {
+            name: (min(hi, shape[0]) - lo, *shape[1:])
+            for name, shape in self.global_shapes().items()
+        }
+
+
+class SharedMemoryExchange:
+    """Halo exchange between the slabs of a `SlabDecomposition`, kept in
+    `multiprocessing.shared_memory` blocks. After each half-step, the workers
+    meet at a barrier and copy the boundary planes of their neighbours into
+    their halos. A message passing version (e.g. over several nodes) only
+    needs to provide the same `exchange_E`/`exchange_H` methods."""
+
+    def __init__(self, decomp, names, barrier, part):
+        self.decomp = decomp
+        self.barrier = barrier
+        self.part = part
+        self.blocks = []
+        # Fields of the slab and of its neighbours
+        self.slabs = {
+            p: self.attach(names[p], decomp.local_shapes(p))
+            for p in [part - 1, part, part + 1]
+            if 0 <= p < decomp.n_parts
+        }
+
+    def attach(self, names, shapes):
+        arrays = {}
+        for name, shape in shapes.items():
+            shm = shared_memory.SharedMemory(name=names[name])
+            self.blocks.append(shm)
+            arrays[name] = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        return arrays
+
+    def fields(self, part=None):
+        """Returns the E, H, coefficient and max E fields of a slab, in the
+        layout used by `MicrowaveOven`."""
+        arrays = self.slabs[self.part if part is None else part]
+        E, H, max_E = (
+            {k: arrays[f"{field}_{k}"] for k in "xyz"} for field in FIELDS
+        )
+        return E, H, {c: arrays[c] for c in COEFS}, max_E
+
+    def copy_plane(self, field, idx, src_part):
+        """Copies the plane `idx` (global x-index) of `field` from a neighbour."""
+        lo = self.decomp.extent(self.part)[0]
+        src_lo = self.decomp.extent(src_part)[0]
+        for k in "xyz":
+            name = f"{field}_{k}"
+            if idx < self.slabs[self.part][name].shape[0] + lo:
+                self.slabs[self.part][name][idx - lo] = self.slabs[src_part][name][
+                    idx - src_lo
+                ]
+
+    def exchange_E(self):
+        """H is updated with E from the next slab: copy its first plane."""
+        self.barrier.wait()
+        if self.part + 1 < self.decomp.n_parts:
+            self.copy_plane("E", self.decomp.owned(self.part)[1], self.part + 1)
+
+    def exchange_H(self):
+        """E is updated with H from the previous slab: copy its last plane."""
+        self.barrier.wait()
+        if self.part > 0:
+            self.copy_plane("H", self.decomp.owned(self.part)[0] - 1, self.part - 1)
+
+    def close(self):
+        self.slabs = {}
+        for shm in self.blocks:
+            shm.close()
+
+
+def run_slab(part, decomp, names, barrier, source, timesteps, probe, track_name):
+    """Runs the time loop of a single slab (in a worker process)."""
+    exchange = SharedMemoryExchange(decomp, names, barrier, part)
+    E, H, coef, max_E = exchange.fields()
+    start, stop = decomp.owned(part)
+    lo = decomp.extent(part)[0]
+    (src_x, src_y, src_z), amplitude, omega, dt = source
+    track_shm = shared_memory.SharedMemory(name=track_name)
+    track_steady = np.ndarray((timesteps,), dtype=np.float64, buffer=track_shm.buf)
+    has_probe = probe is not None and start <= probe[0] < stop
+    # Owned rows of each component, in local indices
+    owned = {k: slice(start - lo, min(stop, v.shape[0] + lo) - lo) for k, v in E.items()}
+
+    try:
+        for N in range(timesteps):
+            yee.update_E(E, H, coef, decomp.shape, (start, stop), lo)
+            if start <= src_x < stop:
+                E["y"][src_x - lo, src_y, src_z] = amplitude * np.cos(
+                    omega * (N + 1) * dt
+                )
+            exchange.exchange_E()
+            yee.update_H(E, H, coef, decomp.shape, (start, stop), lo)
+            exchange.exchange_H()
+            if has_probe:
+                tot = 0
+                for val in E.values():
+                    tot += val[(probe[0] - lo, *probe[1:])] ** 2
+                track_steady[N] = np.sqrt(tot)
+            if N >= 800:
+                # Assume a steady state after 800 timesteps (as `MicrowaveOven.step`)
+                for k, v in max_E.items():
+                    v[owned[k]] = np.maximum(v[owned[k]], np.absolute(E[k][owned[k]]))
+    except BaseException:
+        # Release the other workers waiting at the barrier
+        barrier.abort()
+        raise
+
+    del E, H, coef, max_E, track_steady
+    exchange.close()
+    track_shm.close()
+
+
+class DistributedOven:
+    """Runs a `MicrowaveOven` with its fields decomposed in slabs along x, one
+    per worker process. The slabs live in shared memory and exchange one-cell
+    halos after each half-step. The results (fields, max E, SAR, steady state
+    track) are gathered back on the oven, and match the single process run."""
+
+    def __init__(self, oven, n_workers, timesteps=None):
+        self.oven = oven
+        self.n_workers = n_workers
+        self.timesteps = oven.timesteps if timesteps is None else timesteps
+        self.elapsed = None  # Wall time of the time loop
+
+    def run(self):
+        oven = self.oven
+        oven._init()
+        if oven.subgrids:
+            raise ValueError("Sub-grids are not supported in distributed runs")
+        decomp = SlabDecomposition((oven.Nx, oven.Ny, oven.Nz), self.n_workers)
+        src_slc, amplitude, omega = oven.source_profile()
+        source = (src_slc, amplitude, omega, cfg.grid.dt)
+        probe = STEADY_PROBE
+        if any(p >= n for p, n in zip(probe, (oven.Nx, oven.Ny, oven.Nz))):
+            probe = None  # Grid too coarse for the probe
+
+        blocks = []
+
+        def create(size):
+            shm = shared_memory.SharedMemory(create=True, size=max(size, 1) * 8)
+            blocks.append(shm)
+            return shm
+
+        try:
+            names = []
+            for part in range(decomp.n_parts):
+                lo, hi = decomp.extent(part)
+                part_names = {}
+                for name, shape in decomp.local_shapes(part).items():
+                    shm = create(int(np.prod(shape)))
+                    arr = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+                    arr[:] = self.global_field(name)[lo : lo + shape[0]]
+                    part_names[name] = shm.name
+                    del arr
+                names.append(part_names)
+            track_shm = create(self.timesteps)
+            np.ndarray((self.timesteps,), dtype=np.float64, buffer=track_shm.buf)[:] = 0
+
+            ctx = multiprocessing.get_context()
+            barrier = ctx.Barrier(decomp.n_parts)
+            workers = [
+                ctx.Process(
+                    target=run_slab,
+                    args=(
+                        part, decomp, names, barrier, source, self.timesteps,
+                        probe, track_shm.name,
+                    ),
+                )
+                for part in range(decomp.n_parts)
+            ]
+            t0 = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            self.wait(workers)
+            self.elapsed = time.perf_counter() - t0
+            if any(worker.exitcode != 0 for worker in workers):
+                raise RuntimeError("A worker of the distributed run failed")
+
+            # Gather the owned rows of every slab
+            for part in range(decomp.n_parts):
+                start, stop = decomp.owned(part)
+                lo = decomp.extent(part)[0]
+                for name, shape in decomp.local_shapes(part).items():
+                    if name in COEFS:
+                        continue
+                    shm = shared_memory.SharedMemory(name=names[part][name])
+                    arr = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+                    dest = self.global_field(name)
+                    stop_c = min(stop, dest.shape[0])
+                    dest[start:stop_c] = arr[start - lo : stop_c - lo]
+                    del arr
+                    shm.close()
+            oven.track_steady = np.ndarray(
+                (self.timesteps,), dtype=np.float64, buffer=track_shm.buf
+            ).copy()
+        finally:
+            for shm in blocks:
+                shm.close()
+                shm.unlink()
+        oven.calc_sar()
+        return oven
+
+    @staticmethod
+    def wait(workers):
+        """Joins the workers. If one of them fails, the others are terminated
+        (they would otherwise wait for it at the barrier)."""
+        pending = list(workers)
+        while pending:
+            connection.wait([worker.sentinel for worker in pending])
+            pending = [worker for worker in pending if worker.is_alive()]
+            if any(worker.exitcode not in [None, 0] for worker in workers):
+                for worker in pending:
+                    worker.terminate()
+                break
+        for worker in workers:
+            worker.join()
+
+    def global_field(self, name):
+        """Returns the array of the oven named as in `SlabDecomposition`."""
+        if name in COEFS:
+            return self.oven.coef_fields[name]
+        field, k = name.rsplit("_", 1)
+        return getattr(self.oven, field)[k]
+
+
+def strong_scaling(freq, workers=(1, 2, 4), timesteps=None):
+    """Runs the same oven with an increasing number of workers and returns
+    the (workers, time, speedup, efficiency) of each run."""
+    results = []
+    for n_workers in workers:
+        dist = DistributedOven(MicrowaveOven(freq), n_workers, timesteps)
+        dist.run()
+        results.append((n_workers, dist.elapsed))
+    t_1 = results[0][1] * results[0][0]
+    return [(n, t, t_1 / t, t_1 / t / n) for n, t in results]
+
+
+def print_scaling(results):
+    row_format = "{:>13}" * 4
+    print(row_format.format("Workers", "Time (s)", "Speedup", "Efficiency"))
+    for n, t, speedup, eff in results:
+        print(row_format.format(n, f"{t:.3f}", f"{speedup:.2f}", f"{eff:.2%}"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-f", "--frequency", type=int, default=915, choices=[915, 2450], required=False,
+    )
+    parser.add_argument("-w", "--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("-n", "--timesteps", type=int, default=None, required=False)
+    args = parser.parse_args()
+    print_scaling(strong_scaling(args.frequency, args.workers, args.timesteps))
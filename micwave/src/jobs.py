@@ -0,0 +1,331 @@
+import argparse
+import asyncio
+import copy
+import functools
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import queue
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Tuple
+
+from micwave.src.main import simulate
+from micwave.src.microwave_oven import MicrowaveOven
+from micwave.util.config import COURANT, cfg
+from micwave.util.helpers import nsetattr, sar_table
+
+
+@dataclass
+class Scenario:
+    # Spec of a simulation job
+    freq: int = 915
+    rotations: int = 4
+    subgrid_ratio: int = 1
+    spacing: float = field(default=None)  # Defaults to `cfg.grid.spacing`
+    centers: Dict[str, Tuple] = field(default_factory=dict)  # Initial (x, y) in m
+    every: int = 100  # Timesteps between progress reports
+
+    def __post_init__(self):
+        if self.freq not in [915, 2450]:
+            raise ValueError(f"Unsupported frequency {self.freq}, use 915 or 2450")
+        if self.rotations < 1:
+            raise ValueError(f"At least one rotation is needed, got {self.rotations}")
+        if self.subgrid_ratio < 1:
+            raise ValueError(f"Invalid sub-grid ratio {self.subgrid_ratio}")
+        if self.spacing is not None and not self.spacing > 0:
+            raise ValueError(f"Invalid grid spacing {self.spacing}")
+        if self.every < 1:
+            raise ValueError(f"Invalid progress interval {self.every}")
+
+
+def run_scenario(spec, job_id=None, progress=None):
+    """Runs a scenario and returns its SAR for each angle. Meant to run in a
+    worker process, which is reused between jobs, so `cfg` is restored when done.
+    Progress events are put on the `progress` queue, if given."""
+    dims, grid = copy.deepcopy(cfg.dims), copy.deepcopy(cfg.grid)
+    try:
+        if spec.spacing is not None:
+            cfg.grid.spacing = spec.spacing
+            cfg.grid.dt = COURANT * spec.spacing / cfg.const.c
+        cfg.grid.subgrid_ratio = spec.subgrid_ratio
+        for obj, center in spec.centers.items():
+            nsetattr(cfg.dims, obj + ".center", tuple(center))
+        timesteps = MicrowaveOven(spec.freq).timesteps
+
+        def report(angle, state):
+            if progress is not None:
+                progress.put(
+                    {
+                        "event": "progress",
+                        "job": job_id,
+                        "angle": angle,
+                        "step": state.step,
+                        "timesteps": timesteps,
+                    }
+                )
+
+        sar, _ = simulate(spec.freq, spec.rotations, report, spec.every)
+    finally:
+        cfg.dims, cfg.grid = dims, grid
+    return sar
+
+
+def finite(val):
+    """Returns `val` as a float, or None (null in JSON) if it is not finite,
+    e.g. the σ/μ of an object whose SAR is zero."""
+    val = float(val)
+    return val if math.isfinite(val) else None
+
+
+class Job:
+    def __init__(self, job_id, spec):
+        self.id = job_id
+        self.spec = spec
+        self.status = "queued"  # queued -> running -> done/failed, or cancelled
+        self.progress = None  # Latest progress event
+        self.sar = None
+        self.error = None
+        self.done = asyncio.Event()
+        self.watchers = []  # Queues of the `watch` consumers
+
+    def info(self):
+        """Returns a JSON serializable summary of the job."""
+        info = {
+            "job": self.id,
+            "status": self.status,
+            "spec": asdict(self.spec),
+            "progress": self.progress,
+        }
+        if self.sar is not None:
+            x_headers, y_headers, vals = sar_table(self.sar)
+            info["sar"] = {
+                str(angle): {obj: finite(v) for obj, v in sar.items()}
+                for angle, sar in self.sar.items()
+            }
+            info["table"] = {
+                "objects": x_headers,
+                "columns": [str(h) for h in y_headers],
+                "values": [[finite(v) for v in row] for row in vals],
+            }
+        if self.error is not None:
+            info["error"] = self.error
+        return info
+
+
+class JobServer:
+    """Local job service for batches of oven scenarios.
+
+    Scenarios are queued and dispatched to a bounded process pool, at most
+    `max_workers` at a time. Progress is streamed through `watch`, and the
+    result of a job is its SAR table, as printed by `formatted_output`.
+    The executor and the function running a scenario can be swapped, which
+    keeps the service testable in-process with a stub runner. `run_scenario`
+    itself changes the global `cfg`, so it needs a process pool."""
+
+    def __init__(self, max_workers=None, executor=None, runner=run_scenario):
+        self.max_workers = max_workers or os.cpu_count()
+        self.executor = executor
+        self.runner = runner
+        self.jobs = OrderedDict()
+        self._ids = itertools.count(1)
+        self._manager = None
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._pending = asyncio.Queue()
+        if self.executor is None:
+            # Spawned workers start from a clean `cfg`
+            ctx = multiprocessing.get_context("spawn")
+            self.executor = ProcessPoolExecutor(self.max_workers, mp_context=ctx)
+        if isinstance(self.executor, ProcessPoolExecutor):
+            self._manager = multiprocessing.get_context("spawn").Manager()
+            self._progress = self._manager.Queue()
+        else:
+            self._progress = queue.Queue()
+        self._reader = self._loop.run_in_executor(None, self._read_progress)
+        self._dispatchers = [
+            asyncio.ensure_future(self._dispatch()) for _ in range(self.max_workers)
+        ]
+        return self
+
+    async def stop(self):
+        """Stops the service. Jobs not finished yet are cancelled: the queued
+        ones never start, the running ones are abandoned."""
+        for task in self._dispatchers:
+            task.cancel()
+        await asyncio.gather(*self._dispatchers, return_exceptions=True)
+        for job in self.jobs.values():
+            if not job.done.is_set():
+                self._finish(job, "cancelled", error="Server stopped")
+        self._progress.put(None)
+        await self._reader
+        # Waiting for the running jobs must not block the loop
+        await self._loop.run_in_executor(
+            None, functools.partial(self.executor.shutdown, cancel_futures=True)
+        )
+        if self._manager is not None:
+            self._manager.shutdown()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    def submit(self, spec):
+        """Queues a scenario (a `Scenario` or a dict of its fields) and returns
+        the id of its job."""
+        if not isinstance(spec, Scenario):
+            spec = Scenario(**spec)
+        job = Job(next(self._ids), spec)
+        self.jobs[job.id] = job
+        self._pending.put_nowait(job)
+        return job.id
+
+    def cancel(self, job_id):
+        """Cancels a job that has not started yet. Returns whether it did."""
+        job = self.jobs[job_id]
+        if job.status != "queued":
+            return False
+        self._finish(job, "cancelled")
+        return True
+
+    def status(self, job_id):
+        return self.jobs[job_id].info()
+
+    async def result(self, job_id):
+        """Waits for a job and returns its summary, including the SAR table."""
+        job = self.jobs[job_id]
+        await job.done.wait()
+        if job.status != "done":
+            raise RuntimeError(f"Job {job_id} {job.status}: {job.error}")
+        return job.info()
+
+    async def watch(self, job_id):
+        """Yields the events of a job, until it finishes."""
+        job = self.jobs[job_id]
+        if job.done.is_set():
+            yield job.info()
+            return
+        events = asyncio.Queue()
+        job.watchers.append(events)
+        try:
+            while True:
+                event = await events.get()
+                yield event
+                if event["event"] in ["done", "failed", "cancelled"]:
+                    break
+        finally:
+            job.watchers.remove(events)
+
+    def _notify(self, job, event):
+        for events in job.watchers:
+            events.put_nowait(event)
+
+    def _finish(self, job, status, sar=None, error=None):
+        job.status, job.sar, job.error = status, sar, error
+        try:
+            event = job.info()
+        except Exception as err:
+            # E.g. a result that can not be tabulated
+            job.status, job.sar, job.error = "failed", None, repr(err)
+            event = job.info()
+        try:
+            event["event"] = job.status
+            self._notify(job, event)
+        finally:
+            job.done.set()
+
+    async def _dispatch(self):
+        while True:
+            job = await self._pending.get()
+            if job.status != "queued":
+                continue
+            job.status = "running"
+            self._notify(job, {"event": "running", "job": job.id})
+            try:
+                sar = await self._loop.run_in_executor(
+                    self.executor, self.runner, job.spec, job.id, self._progress
+                )
+            except Exception as err:
+                self._finish(job, "failed", error=repr(err))
+            else:
+                self._finish(job, "done", sar=sar)
+
+    def _read_progress(self):
+        # Runs in a thread, forwarding the events of the workers to the loop
+        while True:
+            event = self._progress.get()
+            if event is None:
+                break
+            self._loop.call_soon_threadsafe(self._on_progress, event)
+
+    def _on_progress(self, event):
+        job = self.jobs.get(event["job"])
+        if job is None or job.status != "running":
+            return
+        job.progress = event
+        self._notify(job, event)
+
+    async def handle(self, reader, writer):
+        """Serves one client. Requests and replies are JSON lines, requests
+        being `{"op": "submit", "spec": {...}}` or `{"op": <"status", "watch",
+        "result", "cancel">, "job": <id>}`."""
+
+        async def send(msg):
+            writer.write((json.dumps(msg) + "\n").encode())
+            await writer.drain()
+
+        async for line in reader:
+            try:
+                request = json.loads(line)
+                op = request["op"]
+                if op == "submit":
+                    await send({"job": self.submit(request["spec"])})
+                elif op == "status":
+                    await send(self.status(request["job"]))
+                elif op == "cancel":
+                    await send({"cancelled": self.cancel(request["job"])})
+                elif op == "watch":
+                    async for event in self.watch(request["job"]):
+                        await send(event)
+                elif op == "result":
+                    await send(await self.result(request["job"]))
+                else:
+                    await send({"error": f"Unknown op {op}"})
+            except (KeyError, TypeError, ValueError, RuntimeError) as err:
+                await send({"error": repr(err)})
+        writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+async def serve(host, port, max_workers):
+    async with JobServer(max_workers) as job_server:
+        await job_server.serve(host, port)
+
+
+def main():
+    """Entrypoint of the job server."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=str, default="127.0.0.1", required=False)
+    parser.add_argument("-p", "--port", type=int, default=8765, required=False)
+    parser.add_argument(
+        "-w", "--workers", type=int, default=None, required=False,
+        help="Size of the process pool (defaults to the number of CPUs)",
+    )
+    args = parser.parse_args()
+    print(f"Serving simulation jobs on {args.host}:{args.port}")
+    asyncio.run(serve(args.host, args.port, args.workers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import numpy as np
+
+from collections import OrderedDict
+
+ALIGN = 64  # Bytes, alignment of the buffers and of their innermost rows
+
+# Regions (per component) updated by the kernels in `yee`, for (Nx, Ny, Nz) cells
+E_REGIONS = [
+    lambda ie, je, ke: (slice(0, ie), slice(1, je), slice(1, ke)),
+    lambda ie, je, ke: (slice(1, ie), slice(0, je), slice(1, ke)),
+    lambda ie, je, ke: (slice(1, ie), slice(1, je), slice(0, ke)),
+]
+H_REGIONS = [
+    lambda ie, je, ke: (slice(1, ie), slice(0, je), slice(0, ke)),
+    lambda ie, je, ke: (slice(0, ie), slice(1, je), slice(0, ke)),
+    lambda ie, je, ke: (slice(0, ie), slice(0, je), slice(1, ke)),
+]
+
+
+def aligned_zeros(shape, align=ALIGN):
+    """Returns a zeroed float64 array whose data starts on an `align` boundary."""
+    nbytes = int(np.prod(shape)) * 8
+    raw = np.zeros(nbytes + align, dtype=np.uint8)
+    offset = (-raw.ctypes.data) % align
+    return raw[offset : offset + nbytes].view(np.float64).reshape(shape)
+
+
+def padded_shape(shape):
+    """Returns the shape of the buffer of a `FieldBuffer` for a uniform box."""
+    row = ALIGN // 8
+    padded = [n + 3 for n in shape]
+    padded[-1] = -(-padded[-1] // row) * row
+    return (3, *padded)
+
+
+class FieldBuffer:
+    """The three components of a field in a single contiguous, aligned 4D
+    buffer (component, x, y, z). Every component is stored in the same uniform
+    (Nx + 1, Ny + 1, Nz + 1) box, with a ghost plane before and two after it
+    on each axis, and the innermost axis padded to whole aligned rows. The
+    staggered components are exposed as dict-style views, so `E["x"]` keeps
+    working as with separately allocated arrays."""
+
+    def __init__(self, shape, comp_shapes):
+        self.shape = shape  # Uniform box
+        self.data = aligned_zeros(padded_shape(shape))
+        self.views = OrderedDict(
+            (k, self.data[(c, *(slice(1, 1 + n) for n in s))])
+            for c, (k, s) in enumerate(comp_shapes.items())
+        )
+
+    def shifted(self, comp, dx, dy, dz):
+        """Component(s) `comp` over the uniform box shifted by (dx, dy, dz)."""
+        return self.data[
+            (comp, *(slice(1 + d, 1 + d + n) for d, n in zip((dx, dy, dz), self.shape)))
+        ]
+
+
+def curl_into(out, a, b, c, d):
+    """Computes `a - b + c - d` into `out`, without temporaries."""
+    np.subtract(a, b, out=out)
+    out += c
+    out -= d
+
+
+# Terms `a - b + c - d` of the curl of each component, as (component, shift)
+# of the other field
+CURL_H = [
+    [(2, (0, 0, 0)), (2, (0, -1, 0)), (1, (0, 0, -1)), (1, (0, 0, 0))],
+    [(0, (0, 0, 0)), (0, (0, 0, -1)), (2, (-1, 0, 0)), (2, (0, 0, 0))],
+    [(0, (0, -1, 0)), (0, (0, 0, 0)), (1, (0, 0, 0)), (1, (-1, 0, 0))],
+]
+CURL_E = [
+    [(1, (0, 0, 1)), (1, (0, 0, 0)), (2, (0, 0, 0)), (2, (0, 1, 0))],
+    [(0, (0, 0, 0)), (0, (0, 0, 1)), (2, (1, 0, 0)), (2, (0, 0, 0))],
+    [(0, (0, 1, 0)), (0, (0, 0, 0)), (1, (0, 0, 0)), (1, (1, 0, 0))],
+]
+
+
+def sweep(field, other, a, b, curl, regions, terms):
+    """`field = a * field + b * curl(other)` for each component, in place and
+    over its update region only. The coefficients `a`, `b` are the
+    (Nx, Ny, Nz) arrays of `coef_fields`, shared by the three components."""
+    for comp, (region, comp_terms) in enumerate(zip(regions, terms)):
+        slc = region(*a.shape)
+        # Contiguous work array of the shape of the region
+        shape = tuple(len(range(*s.indices(n))) for s, n in zip(slc, a.shape))
+        work = curl.reshape(-1)[: int(np.prod(shape))].reshape(shape)
+        curl_into(work, *(other.shifted(c, *shift)[slc] for c, shift in comp_terms))
+        work *= b[slc]
+        view = field.shifted(comp, 0, 0, 0)[slc]
+        view *= a[slc]
+        view += work
+
+
+def update_E(E, H, coef, curl):
+    """Update E fields using FDTD equations, with in-place sweeps over the
+    components. `curl` is a (Nx + 1, Ny + 1, Nz + 1) work array."""
+    sweep(E, H, coef["caE"], coef["cbE"], curl, E_REGIONS, CURL_H)
+
+
+def update_H(E, H, coef, curl):
+    """Update H fields using FDTD equations, with in-place sweeps over the
+    components."""
+    sweep(H, E, coef["daH"], coef["dbH"], curl, H_REGIONS, CURL_E)
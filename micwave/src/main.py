@@ -1,7 +1,9 @@
 import argparse
 import numpy as np
 
+from micwave.src.decomp import DistributedOven
 from micwave.src.microwave_oven import MicrowaveOven
+from micwave.src.planner import calibrate, check_options, estimate, print_plan
 
 import micwave.util.config as config
 from micwave.util.helpers import rotate_plate_clockwise, nsetattr, formatted_output
@@ -16,9 +18,83 @@ def run(freq=None):
         parser.add_argument(
             "-f", "--frequency", type=int, default=915, choices=[915, 2450], required=False,
         )
+        parser.add_argument(
+            "-s",
+            "--subgrid",
+            type=int,
+            default=cfg.grid.subgrid_ratio,
+            required=False,
+            help="Refinement ratio of the sub-grids around the food (1 disables them)",
+        )
+        parser.add_argument(
+            "-w",
+            "--workers",
+            type=int,
+            default=1,
+            required=False,
+            help="Worker processes of the grid decomposition along x",
+        )
+        parser.add_argument(
+            "-t",
+            "--time-block",
+            type=int,
+            default=cfg.grid.time_block,
+            required=False,
+            help="Timesteps per tile with temporal blocking (1 disables it)",
+        )
+        parser.add_argument(
+            "-m",
+            "--mmap",
+            action="store_true",
+            help="Keep the fields in memory-mapped files (out-of-core mode)",
+        )
+        parser.add_argument(
+            "--spacing",
+            type=float,
+            default=None,
+            required=False,
+            help="Grid spacing in m (defaults to cfg.grid.spacing)",
+        )
+        parser.add_argument(
+            "--estimate",
+            action="store_true",
+            help="Print the predicted peak memory and runtime, then exit",
+        )
         args = parser.parse_args()
         freq = args.frequency
+        cfg.grid.subgrid_ratio = args.subgrid
+        cfg.grid.time_block = args.time_block
+        if args.mmap:
+            cfg.grid.storage = "mmap"
+        if args.spacing is not None:
+            if args.spacing <= 0:
+                parser.error(f"Invalid grid spacing {args.spacing}")
+            cfg.grid.spacing = args.spacing
+            cfg.grid.dt = config.COURANT * args.spacing / cfg.const.c
+        try:
+            check_options(args.workers)
+        except ValueError as err:
+            parser.error(str(err))
+        if args.estimate:
+            print_plan(estimate(freq, calibrate(), args.workers))
+            return None
+        return simulate(freq, workers=args.workers)
 
+    return simulate(freq)
+
+
+def simulate(freq, rotations=4, progress=None, every=100, workers=1):
+    """Runs the simulation for each rotation of the plate.
+    Args:
+    - freq -> int: Frequency in MHz.
+    - rotations -> int: Number of plate positions, 90 degrees apart.
+    - progress -> callable: If given, called as `progress(angle, state)` every
+    `every` timesteps with the `StepState` of the simulation. The ovens are
+    not kept in this case, only their SAR.
+    - workers -> int: If more than 1, the grid is split among as many worker
+    processes (see `DistributedOven`). Not combined with `progress`.
+    Returns the SAR for each angle and the ovens."""
+    cfg = config.cfg
     oven = MicrowaveOven(freq)  # Used only to get `foodstuff` var here.
     angle = np.pi / 2  # Since the center positions are saved, always rotate by 90
     objects = oven.foodstuff[:]
@@ -27,10 +103,8 @@ def run(freq=None):
     # Variables used for visualization later.
     total_sar = {}
     ovens = []
-    rot_count = 0
 
-    # Rotate 3 times
-    for _ in range(4):
+    for rot_count in range(rotations):
         for obj in objects:
 
             # Rotate all objects taking as origin the center of the plate
@@ -40,22 +114,31 @@ def run(freq=None):
                 )
                 nsetattr(cfg.dims, obj + ".center", obj_cntr)
         oven = MicrowaveOven(freq)
-        print(
-            f"Oven configuration: \nFrequency {oven.freq} Hz |"
-            f" Source Power: {oven.source_power} V/m | dx = {cfg.grid.spacing} m | "
-            f" dt = {cfg.grid.dt} s |"
-            f" Oven dimensions (x, y, z) = {cfg.dims.oven.x, cfg.dims.oven.y, cfg.dims.oven.z}m | "
-            f"Current rotation angle: {np.degrees(angle) * rot_count}.\n"
-            "Starting Simulation..."
-        )
-        oven.run()
-        total_sar[np.degrees(angle) * rot_count] = oven.sar
-        ovens.append(oven)
-        rot_count += 1
+        rot_angle = np.degrees(angle) * rot_count
+        if progress is None:
+            print(
+                f"Oven configuration: \nFrequency {oven.freq} Hz |"
+                f" Source Power: {oven.source_power} V/m | dx = {cfg.grid.spacing} m | "
+                f" dt = {cfg.grid.dt} s |"
+                f" Sub-grid ratio: {cfg.grid.subgrid_ratio} |"
+                f" Oven dimensions (x, y, z) = {cfg.dims.oven.x, cfg.dims.oven.y, cfg.dims.oven.z}m | "
+                f"Current rotation angle: {rot_angle}.\n"
+                "Starting Simulation..."
+            )
+            if workers > 1:
+                DistributedOven(oven, workers).run()
+            else:
+                oven.run()
+            ovens.append(oven)
+        else:
+            for state in oven.iter_steps(every=every):
+                progress(rot_angle, state)
+        total_sar[rot_angle] = oven.sar
 
     return total_sar, ovens
 
 
 if __name__ == "__main__":
-    sar, snap, E_snap, oven = run()
-    formatted_output(sar)
+    results = run()
+    if results is not None:
+        formatted_output(results[0])
@@ -1,9 +1,12 @@
-import copy
 import numpy as np
+import tempfile
 
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
 from dataclasses import asdict
 
+from micwave.src import layout, yee
+from micwave.src.layout import FieldBuffer
+from micwave.src.subgrid import SubGrid
 from micwave.util.config import cfg
 from micwave.util.helpers import (
     CustomDefDict,
@@ -14,6 +17,11 @@ from micwave.util.helpers import (
 )
 from micwave.util.masks import mask_item, obj_on_grid, obj_indices
 
+STEADY_PROBE = (50, 50, 50)  # Grid point used for tracking the steady state
+
+# State of the simulation reported by `MicrowaveOven.iter_steps`
+StepState = namedtuple("StepState", ["step", "probes", "planes"])
+
 
 class MicrowaveOven:
     def __init__(self, freq):
@@ -24,6 +32,7 @@ class MicrowaveOven:
         self.freq = freq
         self.f_var = None  # Frequency dependent variables of objs
         self.obj_pos = {}  # Contains the grid points of objects
+        self.obj_rect = {}  # Rectangles (slices) around the objects on the grid
         self.obj_indices = {}  # Object indices, used for post-processing
         self.obj_max_E = {}  # Holds arrays with the max values of E for objs
         self.source_power = 117.0  # Source power in (V/m)
@@ -37,6 +46,11 @@ class MicrowaveOven:
         self.period = 1 / self.freq
         self.sar = {}
         self.heatmaps = []
+        self.source_snap = None  # Source values of the latest timestep
+        self.record = False  # Keep the source values and the steady state track
+        self.track_steady = None
+        self.subgrids = []  # Refined sub-domains around the food objects
+        self.E_buf = self.H_buf = self.max_E_buf = None  # Buffers of the soa layout
 
     def init_grid(self):
         """Transform simulation space dimensions to grid points based on
@@ -48,24 +62,54 @@ class MicrowaveOven:
             self.grid_dims["z"],
         )
 
-    def init_fields(self):
-        """Initialize E and H fields to 0."""
-        self.E = OrderedDict()
-        self.E["x"] = np.zeros((self.Nx, self.Ny + 1, self.Nz + 1))
-        self.E["y"] = np.zeros((self.Nx + 1, self.Ny, self.Nz + 1))
-        self.E["z"] = np.zeros((self.Nx + 1, self.Ny + 1, self.Nz))
+    def field_shapes(self):
+        """Returns the (staggered) shapes of the E and H field components."""
+        return {
+            "E": OrderedDict(
+                x=(self.Nx, self.Ny + 1, self.Nz + 1),
+                y=(self.Nx + 1, self.Ny, self.Nz + 1),
+                z=(self.Nx + 1, self.Ny + 1, self.Nz),
+            ),
+            "H": OrderedDict(
+                x=(self.Nx + 1, self.Ny, self.Nz),
+                y=(self.Nx, self.Ny + 1, self.Nz),
+                z=(self.Nx, self.Ny, self.Nz + 1),
+            ),
+        }
 
-        self.H = OrderedDict()
-        self.H["x"] = np.zeros((self.Nx + 1, self.Ny, self.Nz))
-        self.H["y"] = np.zeros((self.Nx, self.Ny + 1, self.Nz))
-        self.H["z"] = np.zeros((self.Nx, self.Ny, self.Nz + 1))
+    def alloc(self, shape, value=0.0):
+        """Allocates a grid array, memory-mapped to a file in out-of-core mode
+        (`cfg.grid.storage == "mmap"`)."""
+        if cfg.grid.storage != "mmap":
+            return np.full(shape, value)
+        # The file is unlinked right away, its space is freed with the array
+        with tempfile.TemporaryFile(prefix="micwave_", dir=cfg.grid.mmap_dir) as f:
+            arr = np.memmap(f, dtype=np.float64, mode="w+", shape=shape)
+        if value != 0:
+            arr[:] = value
+        return arr
+
+    def init_fields(self):
+        """Initialize E and H fields to 0. With the "soa" layout, the components
+        of each field share a padded 4D buffer and `E`/`H` hold views of it."""
+        shapes = self.field_shapes()
+        if cfg.grid.field_layout == "soa":
+            if cfg.grid.storage == "mmap":
+                raise ValueError("The soa layout is not supported in out-of-core runs")
+            uniform = (self.Nx + 1, self.Ny + 1, self.Nz + 1)
+            self.E_buf = FieldBuffer(uniform, shapes["E"])
+            self.H_buf = FieldBuffer(uniform, shapes["H"])
+            self.E, self.H = self.E_buf.views, self.H_buf.views
+            return
+        self.E = OrderedDict((k, self.alloc(v)) for k, v in shapes["E"].items())
+        self.H = OrderedDict((k, self.alloc(v)) for k, v in shapes["H"].items())
 
     def init_space(self):
         """Initialize coefficient fields."""
         self.coef_fields = OrderedDict()
         for c in ["caE", "cbE", "daH", "dbH"]:
-            self.coef_fields[c] = self.coef[c[:-1]]["air"] * np.ones(
-                (self.Nx, self.Ny, self.Nz)
+            self.coef_fields[c] = self.alloc(
+                (self.Nx, self.Ny, self.Nz), self.coef[c[:-1]]["air"]
             )
 
     def add_objects_in_field(self):
@@ -80,6 +124,7 @@ class MicrowaveOven:
             dims = getattr(cfg.dims, obj)
             obj_rect = self.obj_slices(dims)
             obj_mask = mask_item(dims)
+            self.obj_rect[obj] = obj_rect
 
             # Get the grid points of the objects and their indices
             self.obj_pos[obj] = obj_on_grid(
@@ -91,6 +136,53 @@ class MicrowaveOven:
             if obj == "plate":
                 self.min_height += gpt(dims.z)
 
+    def subgrid_boxes(self):
+        """Returns the (coarse) boxes of the sub-grids around the food objects
+        with the objects they hold. Overlapping boxes are merged into one."""
+        pad = cfg.grid.subgrid_pad
+        # Keep the boxes off the walls and the source plane
+        upper = np.array([self.Nx, self.Ny, self.Nz]) - 1
+        boxes = []
+        for obj in self.foodstuff:
+            if obj == "plate":
+                continue
+            lo = np.maximum(self.obj_pos[obj].min(axis=0) - pad, 1)
+            hi = np.minimum(self.obj_pos[obj].max(axis=0) + 1 + pad, upper)
+            boxes.append((lo, hi, [obj]))
+
+        merged = True
+        while merged:
+            merged = False
+            for i in range(len(boxes)):
+                for j in range(i + 1, len(boxes)):
+                    (lo1, hi1, objs1), (lo2, hi2, objs2) = boxes[i], boxes[j]
+                    if np.all(lo1 < hi2) and np.all(lo2 < hi1):
+                        boxes[i] = (
+                            np.minimum(lo1, lo2),
+                            np.maximum(hi1, hi2),
+                            objs1 + objs2,
+                        )
+                        del boxes[j]
+                        merged = True
+                        break
+                if merged:
+                    break
+        return [
+            (tuple(slice(int(l), int(h)) for l, h in zip(lo, hi)), objs)
+            for lo, hi, objs in boxes
+        ]
+
+    def add_subgrids(self):
+        """Embeds refined sub-grids around the food objects, if enabled by
+        `cfg.grid.subgrid_ratio`."""
+        ratio = cfg.grid.subgrid_ratio
+        if ratio <= 1:
+            return
+        for box, objs in self.subgrid_boxes():
+            subgrid = SubGrid(self, box, ratio, objs)
+            subgrid._init()
+            self.subgrids.append(subgrid)
+
     def obj_slices(self, dims):
         """Returns a tuple of slices, used for a creating a rectangle around an
         object to be placed in the oven. Used for masking."""
@@ -106,78 +198,23 @@ class MicrowaveOven:
             obj_z = slice(self.min_height, self.min_height + 2 * gpt(dims.r))
         return (obj_x, obj_y, obj_z)
 
-    def update_E(self):
-        """Update E fields using FDTD equations"""
-        ie, je, ke, = (
-            self.Nx,
-            self.Ny,
-            self.Nz,
-        )
-        ib, jb, kb = (ie + 1, je + 1, ke + 1)
-        self.E["x"][:ie, 1:je, 1:ke] = (
-            self.coef_fields["caE"][:ie, 1:je, 1:ke] * self.E["x"][:ie, 1:je, 1:ke]
-        ) + self.coef_fields["cbE"][:ie, 1:je, 1:ke] * (
-            self.H["z"][:ie, 1:je, 1:ke]
-            - self.H["z"][:ie, : je - 1, 1:ke]
-            + self.H["y"][:ie, 1:je, : ke - 1]
-            - self.H["y"][:ie, 1:je, 1:ke]
-        )
+    def update_E(self, xr=None):
+        """Update E fields using FDTD equations, over the x-range `xr`"""
+        if self.E_buf is not None:
+            layout.update_E(self.E_buf, self.H_buf, self.coef_fields, self.curl)
+            return
+        yee.update_E(self.E, self.H, self.coef_fields, (self.Nx, self.Ny, self.Nz), xr)
 
-        self.E["y"][1:ie, :je, 1:ke] = (
-            self.coef_fields["caE"][1:ie, :je, 1:ke] * self.E["y"][1:ie, :je, 1:ke]
-        ) + self.coef_fields["cbE"][1:ie, :je, 1:ke] * (
-            self.H["x"][1:ie, :je, 1:ke]
-            - self.H["x"][1:ie, :je, : ke - 1]
-            + self.H["z"][: ie - 1, :je, 1:ke]
-            - self.H["z"][1:ie, :je, 1:ke]
-        )
+    def update_H(self, xr=None):
+        """Update H fields using FDTD equations, over the x-range `xr`"""
+        if self.E_buf is not None:
+            layout.update_H(self.E_buf, self.H_buf, self.coef_fields, self.curl)
+            return
+        yee.update_H(self.E, self.H, self.coef_fields, (self.Nx, self.Ny, self.Nz), xr)
 
-        self.E["z"][1:ie, 1:je, :ke] = (
-            self.coef_fields["caE"][1:ie, 1:je, :ke] * self.E["z"][1:ie, 1:je, :ke]
-        ) + self.coef_fields["cbE"][1:ie, 1:je, :ke] * (
-            self.H["x"][1:ie, : je - 1, :ke]
-            - self.H["x"][1:ie, 1:je, :ke]
-            + self.H["y"][1:ie, 1:je, :ke]
-            - self.H["y"][: ie - 1, 1:je, :ke]
-        )
-
-    def update_H(self):
-        """Update H fields using FDTD equations"""
-        ie, je, ke, = (
-            self.Nx,
-            self.Ny,
-            self.Nz,
-        )
-        ib, jb, kb = (ie + 1, je + 1, ke + 1)
-        self.H["x"][1:ie, :je, :ke] = (
-            self.coef_fields["daH"][1:ie, :je, :ke] * self.H["x"][1:ie, :je, :ke]
-        ) + self.coef_fields["dbH"][1:ie, :je, :ke] * (
-            self.E["y"][1:ie, :je, 1:kb]
-            - self.E["y"][1:ie, :je, :ke]
-            + self.E["z"][1:ie, :je, :ke]
-            - self.E["z"][1:ie, 1:jb, :ke]
-        )
-
-        self.H["y"][:ie, 1:je, :ke] = (
-            self.coef_fields["daH"][:ie, 1:je, :ke] * self.H["y"][:ie, 1:je, :ke]
-        ) + self.coef_fields["dbH"][:ie, 1:je, :ke] * (
-            self.E["x"][:ie, 1:je, :ke]
-            - self.E["x"][:ie, 1:je, 1:kb]
-            + self.E["z"][1:ib, 1:je, :ke]
-            - self.E["z"][:ie, 1:je, :ke]
-        )
-
-        self.H["z"][:ie, :je, 1:ke] = (
-            self.coef_fields["daH"][:ie, :je, 1:ke] * self.H["z"][:ie, :je, 1:ke]
-        ) + self.coef_fields["dbH"][:ie, :je, 1:ke] * (
-            self.E["x"][:ie, 1:jb, 1:ke]
-            - self.E["x"][:ie, :je, 1:ke]
-            + self.E["y"][:ie, :je, 1:ke]
-            - self.E["y"][1:ib, :je, 1:ke]
-        )
-
-    def update_source(self, N):
-        """Updates the source on the grid. `N` is the timestep"""
+    def source_profile(self):
+        """Returns the position of the source on the grid (tuple of indices),
+        its amplitude profile and its angular frequency."""
         src_c = cfg.grid.src_corn  # Coordinates of source "lower-left" corner
         src_d = cfg.dims.source  # Dimensions of source
 
@@ -190,10 +227,17 @@ class MicrowaveOven:
 
         src_y = np.sin(np.pi * (y_pts - src_c.y) / src_d.y)
         sin_part = np.transpose([src_y] * gpt(src_d.z))
+        return (src_slc_x, src_slc_y, src_slc_z), self.source_power * sin_part, omega
+
+    def update_source(self, N):
+        """Updates the source on the grid. `N` is the timestep"""
+        src_slc, amplitude, omega = self.source_profile()
         cos_part = np.cos(omega * (N + 1) * cfg.grid.dt)
-        total = self.source_power * sin_part * cos_part
-        self.heatmaps.append(total)
-        self.E["y"][src_slc_x, src_slc_y, src_slc_z] = total
+        total = amplitude * cos_part
+        self.source_snap = total
+        if self.record:
+            self.heatmaps.append(total)
+        self.E["y"][src_slc] = total
 
     def calc_sar(self):
         """Calculates the SAR value for each object, based on the maximum
@@ -210,6 +254,10 @@ class MicrowaveOven:
                 * total_E
                 * cfg.grid.spacing ** 3
             ) / (getattr(self.f_var, obj).dens)
+        for subgrid in self.subgrids:
+            # The refined values take over for the objects in sub-grids
+            subgrid.calc_sar()
+            self.sar.update(subgrid.sar)
 
     def slc_len(self, slc):
         """Returns the length of a slice object"""
@@ -229,36 +277,153 @@ class MicrowaveOven:
             tot += val[(*pt,)] ** 2
         return np.sqrt(tot)
 
-    def compare_E(self):
-        """Updates the maximum absolute value for each E field"""
-        for k, v in self.max_E.items():
-            self.max_E[k] = np.maximum(self.max_E[k], np.absolute(self.E[k]))
+    def compare_E(self, xr=None):
+        """Updates the maximum absolute value for each E field, over the
+        x-range `xr` (the whole grid by default)"""
+        if self.max_E_buf is not None:
+            # Single sweep over all components (and the padding, which is 0)
+            data = self.max_E_buf.data
+            np.maximum(data, np.absolute(self.E_buf.data), out=data)
+        else:
+            slc = slice(None) if xr is None else slice(*xr)
+            for k, v in self.max_E.items():
+                np.maximum(v[slc], np.absolute(self.E[k][slc]), out=v[slc])
+        if xr is None:
+            for subgrid in self.subgrids:
+                subgrid.compare_E()
 
     def _init(self):
         self.init_grid()
         self.init_fields()
         self.init_space()
         self.add_objects_in_field()
-        self.max_E = copy.deepcopy(self.E)
+        self.add_subgrids()
+        if self.E_buf is not None:
+            self.curl = np.zeros(self.E_buf.shape)
+            self.max_E_buf = FieldBuffer(self.E_buf.shape, self.field_shapes()["E"])
+            self.max_E = self.max_E_buf.views
+        else:
+            self.max_E = OrderedDict(
+                (k, self.alloc(v.shape)) for k, v in self.E.items()
+            )
 
-    def run(self):
-        """Actually run the simulation"""
-        self._init()
-        timesteps = 2 * int(
+    @property
+    def timesteps(self):
+        """Total number of timesteps of the simulation"""
+        return 2 * int(
             2
             * (cfg.dims.oven.x / self.wavelength)
             * self.period
             / cfg.grid.dt
         )
-        print("Total Timesteps: ", timesteps)
-        self.track_steady = np.zeros(timesteps)
-        for N in range(timesteps):
-            self.update_E()
-            self.update_source(N)
-            self.update_H()
-            self.track_steady[N] = self.calc_tot_E_pt([50, 50, 50])
-            if N >= 800:
-                # Assume a steady state after 800 timesteps and
-                # start calculating maximums for E fields now.
-                self.compare_E()
+
+    def plane_E(self, axis, offset):
+        """Returns the RSS total electric field on a plane normal to `axis`"""
+        slc = tuple(
+            offset if ax == axis else slice(None) for ax in ["x", "y", "z"]
+        )
+        tot = 0
+        for val in list(self.E.values()):
+            tot += val[: self.Nx, : self.Ny, : self.Nz][slc] ** 2
+        return np.sqrt(tot)
+
+    def step(self, N):
+        """Advances the simulation by one timestep. `N` is the timestep"""
+        self.update_E()
+        self.update_source(N)
+        for subgrid in self.subgrids:
+            subgrid.advance(self.E)
+        self.update_H()
+        self.observe(N)
+
+    def observe(self, N, xr=None):
+        """Post-processing of timestep `N` once E is final over the x-range
+        `xr` (the whole grid by default)."""
+        if self.track_steady is not None and (
+            xr is None or xr[0] <= STEADY_PROBE[0] < xr[1]
+        ):
+            self.track_steady[N] = self.calc_tot_E_pt(STEADY_PROBE)
+        if N >= 800:
+            # Assume a steady state after 800 timesteps and
+            # start calculating maximums for E fields now.
+            self.compare_E(xr)
+
+    def advance(self, N0, steps):
+        """Advances the simulation from timestep `N0` by `steps` timesteps,
+        in blocks of `cfg.grid.time_block` timesteps if set. Out-of-core runs
+        are processed in slabs of `cfg.grid.slab_width` x-planes."""
+        block = cfg.grid.time_block
+        out_of_core = cfg.grid.storage == "mmap"
+        if block <= 1 and not out_of_core:
+            for N in range(N0, N0 + steps):
+                self.step(N)
+            return
+        if self.subgrids:
+            raise ValueError(
+                "Sub-grids are not supported with temporal blocking or out-of-core runs"
+            )
+        if self.E_buf is not None:
+            raise ValueError("The soa layout is not supported with temporal blocking")
+        width = cfg.grid.slab_width if out_of_core else cfg.grid.tile_width
+        block = max(block, 1)
+        for N in range(N0, N0 + steps, block):
+            self.advance_tiled(N, min(block, N0 + steps - N), width)
+
+    def advance_tiled(self, N0, steps, width):
+        """Advances `steps` timesteps with temporal blocking: the grid is cut
+        in tiles of `width` x-planes, and each tile is advanced
+        over all the timesteps before moving to the next one, while it is
+        still in cache. The tiles are skewed by 2 planes per timestep (E at
+        `i` needs H at `i - 1`, H at `i` needs E at `i + 1`), so every update
+        sees the same values as in `step`, and the results are identical.
+        The source and the post-processing are applied by the tile holding
+        them, at each timestep. With a single timestep, this is a sweep over
+        slabs of the grid."""
+        n_x = self.Nx + 1  # x-planes of the staggered components
+        src_x = self.source_profile()[0][0]
+        # Tile edges at the first timestep, shifted by -2 at each timestep
+        edges = list(range(width, n_x + 2 * steps, width))
+        starts, stops = [None] + edges, edges + [None]
+        for start, stop in zip(starts, stops):
+            for t in range(steps):
+                e0, h0 = (0, 0) if start is None else (start - 2 * t, start - 2 * t - 1)
+                e1, h1 = (n_x, n_x) if stop is None else (stop - 2 * t, stop - 2 * t - 1)
+                e0, e1, h0, h1 = (min(max(x, 0), n_x) for x in (e0, e1, h0, h1))
+                if e1 > e0:
+                    self.update_E((e0, e1))
+                    if e0 <= src_x < e1:
+                        self.update_source(N0 + t)
+                    self.observe(N0 + t, (e0, e1))
+                if h1 > h0:
+                    self.update_H((h0, h1))
+
+    def iter_steps(self, every=1, probes=(), planes=()):
+        """Runs the simulation as a generator, yielding a `StepState` every
+        `every` timesteps and at the last one. Nothing is kept between yields,
+        so the caller can stream the results or stop early.
+        Args:
+        - every -> int: Timesteps between two yields.
+        - probes -> list: Grid points whose RSS E is reported.
+        - planes -> list: (axis, offset) pairs of the planes whose RSS E is reported.
+        The SAR is calculated once the generator is exhausted."""
+        self._init()
+        timesteps = self.timesteps
+        N = 0
+        while N < timesteps:
+            steps = min(every - N % every, timesteps - N)  # Up to the next yield
+            self.advance(N, steps)
+            N += steps
+            yield StepState(
+                N - 1,
+                {tuple(pt): self.calc_tot_E_pt(pt) for pt in probes},
+                {tuple(plane): self.plane_E(*plane) for plane in planes},
+            )
         self.calc_sar()
+
+    def run(self):
+        """Actually run the simulation"""
+        print("Total Timesteps: ", self.timesteps)
+        self.record = True
+        self.track_steady = np.zeros(self.timesteps)
+        for _ in self.iter_steps(every=self.timesteps):
+            pass
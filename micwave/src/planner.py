@@ -0,0 +1,176 @@
+import os
+import time
+import numpy as np
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Tuple
+
+from micwave.src import yee
+from micwave.src.layout import padded_shape
+from micwave.src.microwave_oven import MicrowaveOven
+from micwave.util.config import cfg
+
+CELL_UPDATE_TIME = 4.5e-8  # Seconds per cell and timestep (E and H), measured
+ITEMSIZE = np.dtype(np.float64).itemsize
+
+
+@dataclass
+class MemoryPlan:
+    # Predicted resources of a simulation, see `estimate`
+    shape: Tuple[int, int, int]
+    timesteps: int
+    arrays: Dict[str, int] = field(default_factory=OrderedDict)  # Bytes per group
+    ram: int = 0  # Peak resident bytes
+    disk: int = 0  # Bytes of memory-mapped files
+    runtime: float = 0  # Seconds, for a single rotation
+    available: int = None  # Physical memory of the machine, if known
+    workers: int = 1
+
+
+def nbytes(*shapes):
+    return sum(int(np.prod(shape)) for shape in shapes) * ITEMSIZE
+
+
+def physical_memory():
+    """Returns the physical memory of the machine in bytes, if known."""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def calibrate(n=64, steps=5):
+    """Measures the time per cell and timestep of the Yee kernels on this
+    machine, on a small synthetic grid."""
+    oven = MicrowaveOven(915)
+    oven.Nx = oven.Ny = oven.Nz = n
+    shapes = oven.field_shapes()
+    E, H = ({k: np.zeros(v) for k, v in shapes[f].items()} for f in ["E", "H"])
+    coef = {c: np.ones((n, n, n)) for c in ["caE", "cbE", "daH", "dbH"]}
+    t0 = time.perf_counter()
+    for _ in range(steps):
+        yee.update_E(E, H, coef, (n, n, n))
+        yee.update_H(E, H, coef, (n, n, n))
+    return (time.perf_counter() - t0) / (steps * n ** 3)
+
+
+def check_options(workers=1):
+    """Raises a ValueError if the current `cfg` (sub-grids, temporal blocking,
+    storage) and the number of `workers` can not be run together."""
+    out_of_core = cfg.grid.storage == "mmap"
+    if cfg.grid.subgrid_ratio > 1:
+        if out_of_core or cfg.grid.time_block > 1:
+            raise ValueError(
+                "Sub-grids are not supported with temporal blocking or out-of-core runs"
+            )
+        if workers > 1:
+            raise ValueError("Sub-grids are not supported in distributed runs")
+    if cfg.grid.field_layout == "soa" and (out_of_core or cfg.grid.time_block > 1):
+        raise ValueError(
+            "The soa layout does not support temporal blocking or out-of-core storage"
+        )
+    if workers > 1 and (out_of_core or cfg.grid.time_block > 1):
+        raise ValueError(
+            "Distributed runs do not support temporal blocking or out-of-core storage"
+        )
+
+
+def estimate(freq=915, cell_time=None, workers=1):
+    """Predicts the peak memory and the runtime of a simulation with the
+    current `cfg` (grid spacing, oven size, sub-grids, temporal blocking,
+    storage and field layout) and `workers` processes, without allocating
+    the grid. `cell_time` is the time per cell and timestep, see `calibrate`.
+    Raises a ValueError for options that can not be run together, see
+    `check_options`."""
+    check_options(workers)
+    cell_time = CELL_UPDATE_TIME if cell_time is None else cell_time
+    oven = MicrowaveOven(freq)
+    oven.init_grid()
+    shapes = oven.field_shapes()
+    cells = (oven.Nx, oven.Ny, oven.Nz)
+
+    arrays = OrderedDict()
+    soa = cfg.grid.field_layout == "soa"
+    if soa:
+        # Padded buffers holding the three components
+        uniform = tuple(n + 1 for n in cells)
+        arrays["E"] = arrays["H"] = nbytes(padded_shape(uniform))
+    else:
+        arrays["E"] = nbytes(*shapes["E"].values())
+        arrays["H"] = nbytes(*shapes["H"].values())
+    arrays["max_E"] = arrays["E"]
+    arrays["coef"] = 4 * nbytes(cells)
+    # The kernels hold ~3 temporaries of the largest component at once
+    largest = max(nbytes(shape) for f in shapes.values() for shape in f.values())
+    if cfg.grid.storage == "mmap":
+        largest = largest * min(cfg.grid.slab_width, oven.Nx) // oven.Nx
+    elif cfg.grid.time_block > 1:
+        largest = largest * min(cfg.grid.tile_width, oven.Nx) // oven.Nx
+    arrays["temporaries"] = 3 * largest
+    if soa and workers == 1:
+        # The in-place kernels only need their curl work array
+        arrays["temporaries"] = nbytes(uniform)
+    if workers > 1:
+        # The slabs are copies of the fields and coefficients in shared
+        # memory (plus two halo planes each), next to the arrays of the oven
+        grid_bytes = arrays["E"] + arrays["H"] + arrays["max_E"] + arrays["coef"]
+        arrays["shared"] = grid_bytes * (oven.Nx + 1 + 2 * workers) // (oven.Nx + 1)
+
+    updates = int(np.prod(cells))
+    ratio = cfg.grid.subgrid_ratio
+    if ratio > 1:
+        oven.add_objects()
+        fine = 0
+        for box, _ in oven.subgrid_boxes():
+            fine += int(np.prod([ratio * oven.slc_len(slc) + 1 for slc in box]))
+        # Fields, max E and coefficients
+        arrays["subgrids"] = 13 * fine * ITEMSIZE
+        updates += ratio * fine  # `ratio` local timesteps per coarse one
+
+    plan = MemoryPlan(
+        cells, oven.timesteps, arrays, available=physical_memory(), workers=workers
+    )
+    grid_bytes = arrays["E"] + arrays["H"] + arrays["max_E"] + arrays["coef"]
+    if cfg.grid.storage == "mmap":
+        plan.disk = grid_bytes
+        plan.ram = sum(arrays.values()) - grid_bytes
+    else:
+        plan.ram = sum(arrays.values())
+    # Assumes a perfect scaling of the distributed run
+    plan.runtime = plan.timesteps * updates * cell_time / workers
+    return plan
+
+
+def human_bytes(size):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def print_plan(plan):
+    print(
+        f"Grid (x, y, z) = {plan.shape} cells | dx = {cfg.grid.spacing} m |"
+        f" Storage: {cfg.grid.storage} | Time block: {cfg.grid.time_block} |"
+        f" Workers: {plan.workers} | Timesteps: {plan.timesteps}"
+    )
+    for name, size in plan.arrays.items():
+        print("{:>13}{:>13}".format(name, human_bytes(size)))
+    print("{:>13}{:>13}".format("Peak RAM", human_bytes(plan.ram)))
+    if plan.disk:
+        print("{:>13}{:>13}".format("Disk", human_bytes(plan.disk)))
+    print(
+        "{:>13}{:>13}".format("Runtime", f"{plan.runtime:.0f} s"),
+        "(per rotation)",
+    )
+    if plan.available is not None and plan.ram > plan.available:
+        hint = ""
+        if cfg.grid.storage != "mmap" and "subgrids" not in plan.arrays:
+            if plan.workers == 1:
+                hint = ", consider the out-of-core mode (`--mmap`)"
+        print(
+            f"The peak memory exceeds the {human_bytes(plan.available)} of this"
+            f" machine{hint}."
+        )
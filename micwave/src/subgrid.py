@@ -0,0 +1,166 @@
+import numpy as np
+
+from collections import OrderedDict
+
+from micwave.src import yee
+from micwave.util.config import cfg
+from micwave.util.helpers import get_coefficients, vol
+from micwave.util.masks import refined_mask
+
+AXES = ["x", "y", "z"]
+
+
+class SubGrid:
+    """A refined Yee sub-domain embedded in the coarse oven grid.
+
+    Both spacing and timestep are `ratio` times smaller than the coarse ones,
+    so the sub-grid takes `ratio` local timesteps for every coarse one. The
+    tangential E on its faces is interpolated (in space and time) from the
+    coarse grid, while the fine E inside the box is averaged back onto the
+    coarse grid after each coarse timestep."""
+
+    def __init__(self, oven, box, ratio, objects):
+        self.oven = oven
+        self.box = box  # Slices of the coarse grid covered by the sub-grid
+        self.ratio = ratio
+        self.foodstuff = objects  # Objects whose SAR is computed here
+        self.spacing = cfg.grid.spacing / ratio
+        self.dt = cfg.grid.dt / ratio
+        self.coarse_dims = tuple(oven.slc_len(slc) for slc in box)
+        self.Nx, self.Ny, self.Nz = (ratio * n for n in self.coarse_dims)
+        self.coef = get_coefficients(oven.freq // 10 ** 6, self.dt, self.spacing)
+        self.obj_indices = {}
+        self.sar = {}
+
+    def init_fields(self):
+        """Initialize E and H fields to 0."""
+        self.E = OrderedDict()
+        self.E["x"] = np.zeros((self.Nx, self.Ny + 1, self.Nz + 1))
+        self.E["y"] = np.zeros((self.Nx + 1, self.Ny, self.Nz + 1))
+        self.E["z"] = np.zeros((self.Nx + 1, self.Ny + 1, self.Nz))
+
+        self.H = OrderedDict()
+        self.H["x"] = np.zeros((self.Nx + 1, self.Ny, self.Nz))
+        self.H["y"] = np.zeros((self.Nx, self.Ny + 1, self.Nz))
+        self.H["z"] = np.zeros((self.Nx, self.Ny, self.Nz + 1))
+        self.max_E = OrderedDict((k, np.zeros(v.shape)) for k, v in self.E.items())
+
+    def init_space(self):
+        """Initialize coefficient fields, with the objects voxelized on the
+        refined grid."""
+        self.coef_fields = OrderedDict()
+        for c in ["caE", "cbE", "daH", "dbH"]:
+            self.coef_fields[c] = self.coef[c[:-1]]["air"] * np.ones(
+                (self.Nx, self.Ny, self.Nz)
+            )
+        for obj in self.oven.foodstuff:
+            mask = refined_mask(
+                getattr(cfg.dims, obj), self.oven.obj_rect[obj], self.box, self.ratio
+            )
+            if obj in self.foodstuff:
+                self.obj_indices[obj] = np.nonzero(mask)
+            for c in ["caE", "cbE", "daH", "dbH"]:
+                self.coef_fields[c][mask] = self.coef[c[:-1]][obj]
+
+    def init_boundary(self):
+        """Precomputes the interpolation weights of the tangential E on the
+        faces of the sub-grid. The kernels in `yee` never update those
+        values, so they act as the boundary condition of the sub-grid."""
+        self.faces = []
+        for d, comp in enumerate(AXES):
+            weights = [
+                self.axis_weights(ax, staggered=ax == d) for ax in range(3)
+            ]
+            for ax in range(3):
+                if ax == d:
+                    continue
+                for idx, node in [(0, self.box[ax].start), (-1, self.box[ax].stop)]:
+                    fine_idx = tuple(
+                        idx if i == ax else slice(None) for i in range(3)
+                    )
+                    face_w = weights[:]
+                    face_w[ax] = (np.array([node]), np.zeros(1))
+                    self.faces.append((comp, ax, fine_idx, face_w))
+        self.bnd = [0.0] * len(self.faces)
+
+    def axis_weights(self, ax, staggered):
+        """Returns the coarse indices and linear interpolation weights of the
+        fine grid points along axis `ax`. Staggered components sit at the
+        middle of the cell edges, the rest on the nodes."""
+        r = self.ratio
+        n_fine = r * self.coarse_dims[ax] + (0 if staggered else 1)
+        pts = np.arange(n_fine) / r
+        if staggered:
+            pts = pts + 0.5 / r - 0.5
+        pts += self.box[ax].start
+        lo = np.floor(pts).astype(int)
+        return (lo, pts - lo)
+
+    def prolong(self, E):
+        """Interpolates the coarse E fields on the faces of the sub-grid."""
+        vals = []
+        for comp, ax, _, face_w in self.faces:
+            val = E[comp]
+            # Interpolate along the face normal first (it is a single plane)
+            for i in [ax] + [i for i in range(3) if i != ax]:
+                lo, w = face_w[i]
+                w = w.reshape([-1 if j == i else 1 for j in range(3)])
+                val = val.take(lo, axis=i) * (1 - w) + val.take(
+                    np.minimum(lo + 1, val.shape[i] - 1), axis=i
+                ) * w
+            vals.append(val.take(0, axis=ax))
+        return vals
+
+    def restrict(self, E):
+        """Averages the fine E fields back onto the coarse grid, in the
+        interior of the sub-grid."""
+        r = self.ratio
+        for d, comp in enumerate(AXES):
+            coarse_idx = tuple(
+                self.box[i] if i == d else slice(self.box[i].start + 1, self.box[i].stop)
+                for i in range(3)
+            )
+            fine_idx = tuple(
+                slice(None) if i == d else slice(r, r * self.coarse_dims[i], r)
+                for i in range(3)
+            )
+            fine = self.E[comp][fine_idx]
+            shape = list(fine.shape)
+            shape[d : d + 1] = [shape[d] // r, r]
+            E[comp][coarse_idx] = fine.reshape(shape).mean(axis=d + 1)
+
+    def advance(self, E):
+        """Advances the sub-grid by one coarse timestep, with `E` the coarse
+        E fields at the end of that timestep, and couples the result back."""
+        bnd = self.prolong(E)
+        shape = (self.Nx, self.Ny, self.Nz)
+        for m in range(1, self.ratio + 1):
+            yee.update_E(self.E, self.H, self.coef_fields, shape)
+            t = m / self.ratio  # Linear interpolation in time
+            for (comp, _, fine_idx, _), old, new in zip(self.faces, self.bnd, bnd):
+                self.E[comp][fine_idx] = (1 - t) * old + t * new
+            yee.update_H(self.E, self.H, self.coef_fields, shape)
+        self.bnd = bnd
+        self.restrict(E)
+
+    def compare_E(self):
+        """Updates the maximum absolute value for each E field"""
+        for k, v in self.max_E.items():
+            self.max_E[k] = np.maximum(v, np.absolute(self.E[k]))
+
+    def calc_sar(self):
+        """Calculates the SAR value for each object on the refined grid."""
+        for obj in self.foodstuff:
+            total_E = 0
+            for energy in self.max_E.values():
+                total_E += np.sum(energy[self.obj_indices[obj]] ** 2)
+            obj_vol = vol(getattr(cfg.dims, obj))
+            f_var = getattr(self.oven.f_var, obj)
+            self.sar[obj] = (
+                (1 / obj_vol) * f_var.sigma * total_E * self.spacing ** 3
+            ) / f_var.dens
+
+    def _init(self):
+        self.init_fields()
+        self.init_space()
+        self.init_boundary()
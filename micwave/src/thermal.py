@@ -0,0 +1,134 @@
+import numpy as np
+
+from micwave.util.config import cfg
+from micwave.util.sar import domains, local_sar
+
+
+class ThermalSolver:
+    """Explicit finite-volume heat diffusion driven by the SAR,
+
+        rho * c * dT/dt = div(k grad T) + rho * SAR,
+
+    with convection to the air on the surface of the objects. It runs on the
+    bounding boxes of the objects, stacked along the first axis (as given by
+    `local_sar`), which advance with a common timestep. `thermal_solvers`
+    gives each object its own solver, so that its timestep only depends on
+    its own properties. The objects do not exchange heat with each other."""
+
+    def __init__(self, sar, dens, k, c, spacing):
+        self.sar = sar  # (n_obj, X, Y, Z) W/kg
+        self.dens = dens
+        self.k = k
+        self.c = c
+        self.spacing = spacing
+        self.tissue = dens > 0
+        self.T = np.where(self.tissue, cfg.thermal.T0, np.nan)
+        self.time = 0.0
+        self.init_conductance()
+
+    def init_conductance(self):
+        """Computes the face conductances (harmonic mean of `k`, 0 if a side
+        is out of the object), the exposed faces of each voxel and the stable
+        timestep. Called again whenever the properties change."""
+        self.k_face = []
+        self.diag = np.zeros(self.T.shape)  # Sum of the conductances of a voxel
+        exposed = np.zeros(self.T.shape)  # Faces in contact with the air
+        padded = np.pad(self.tissue, [(0, 0)] + [(1, 1)] * 3)
+        for ax in range(1, 4):
+            k_lo, k_hi = self.side(self.k, ax, 0), self.side(self.k, ax, 1)
+            both = self.side(self.tissue, ax, 0) & self.side(self.tissue, ax, 1)
+            k_face = np.zeros(k_lo.shape)
+            k_face[both] = 2 * k_lo[both] * k_hi[both] / (k_lo[both] + k_hi[both])
+            self.k_face.append(k_face)
+            self.diag[self.side_slc(ax, 0)] += k_face
+            self.diag[self.side_slc(ax, 1)] += k_face
+            for shift in [0, 2]:
+                slc = [slice(None)] + [slice(1, -1)] * 3
+                slc[ax] = slice(shift, shift + self.T.shape[ax])
+                exposed += self.tissue & ~padded[tuple(slc)]
+        self.exposed = exposed
+        self.inv_rho_c = np.zeros(self.T.shape)
+        self.inv_rho_c[self.tissue] = 1 / (self.dens * self.c)[self.tissue]
+        # Stability limit of the explicit scheme
+        rate = (
+            self.diag / self.spacing ** 2 + cfg.thermal.h * self.exposed / self.spacing
+        ) * self.inv_rho_c
+        self.dt = cfg.thermal.safety / rate.max()
+
+    @staticmethod
+    def side_slc(ax, upper):
+        slc = [slice(None)] * 4
+        slc[ax] = slice(1, None) if upper else slice(None, -1)
+        return tuple(slc)
+
+    def side(self, vals, ax, upper):
+        return vals[self.side_slc(ax, upper)]
+
+    def step(self, dt):
+        """Advances the temperature by `dt` seconds."""
+        T = np.where(self.tissue, self.T, 0)
+        heat = self.dens * self.sar  # W/m^3
+        heat = heat + cfg.thermal.h * self.exposed * (cfg.thermal.T_air - T) / self.spacing
+        for ax, k_face in enumerate(self.k_face, 1):
+            flux = k_face * np.diff(T, axis=ax) / self.spacing ** 2
+            heat[self.side_slc(ax, 0)] += flux
+            heat[self.side_slc(ax, 1)] -= flux
+        self.T += dt * heat * self.inv_rho_c
+        self.time += dt
+
+    def run(self, duration, couple=None, couple_every=None):
+        """Heats the objects for `duration` seconds, with the largest stable
+        timestep. If given, `couple(solver)` is called every `couple_every`
+        seconds and may update `sar`, `k` and `c` (e.g. for properties that
+        depend on the temperature); the timestep is then adapted."""
+        if couple is not None and not couple_every:
+            raise ValueError("`couple_every` is required with `couple`")
+        end = self.time + duration
+        next_couple = self.time + couple_every if couple is not None else np.inf
+        while self.time < end:
+            dt = min(self.dt, end - self.time, next_couple - self.time)
+            self.step(dt)
+            if self.time >= next_couple:
+                couple(self)
+                self.init_conductance()
+                next_couple += couple_every
+        return self
+
+
+def thermal_solvers(oven, objects=None):
+    """Returns a `ThermalSolver` (with the object name) for each of `objects`
+    of a simulated oven, on the grid holding it (the coarse grid or its
+    sub-grid). Defaults to all the objects but the plate."""
+    if objects is None:
+        objects = [obj for obj in oven.foodstuff if obj != "plate"]
+    solvers = []
+    for max_E, indices, spacing, grid_objects in domains(oven):
+        for obj in grid_objects:
+            if obj not in objects:
+                continue
+            origins, sar, dens = local_sar(max_E, indices, oven.f_var, [obj])
+            k = np.full(sar.shape, cfg.thermal.items[obj].k)
+            c = np.full(sar.shape, cfg.thermal.items[obj].c)
+            solver = ThermalSolver(sar, dens, k, c, spacing)
+            solver.objects, solver.origins = [obj], origins
+            solvers.append(solver)
+    return solvers
+
+
+def heat_oven(oven, duration, couple=None, couple_every=None, objects=None):
+    """Heats the objects of a simulated oven (all but the plate by default)
+    for `duration` seconds and returns their min (cold spot), mean and max
+    temperature."""
+    report = {}
+    for solver in thermal_solvers(oven, objects):
+        solver.run(duration, couple, couple_every)
+        for n, obj in enumerate(solver.objects):
+            T = solver.T[n][solver.tissue[n]]
+            report[obj] = {"min": T.min(), "mean": T.mean(), "max": T.max()}
+    return report
+
+
+def print_thermal_report(report, duration):
+    print(("{:>13}" * 4).format(f"T (C) {duration:g}s", "min", "mean", "max"))
+    for obj, vals in report.items():
+        print(("{:>13}" + "{:>13.4}" * 3).format(obj, *vals.values()))
@@ -0,0 +1,80 @@
+def update_E(E, H, coef, shape, xr=None, off=0):
+    """Update E fields using FDTD equations.
+    Args:
+    - E, H -> dict: Field components, keyed by axis.
+    - coef -> dict: Coefficient fields (`caE`, `cbE`, ...).
+    - shape -> tuple: (Nx, Ny, Nz) cell count of the whole domain.
+    - xr -> tuple: Restricts the update to the x-indices [start, stop).
+    - off -> int: x-index of the first row stored in the arrays (non zero
+    only when the arrays hold a slab of the domain)."""
+    ie, je, ke = shape
+    x0, x1 = (0, ie + 1) if xr is None else xr
+
+    a, b = max(x0, 0) - off, min(x1, ie) - off
+    if b > a:
+        E["x"][a:b, 1:je, 1:ke] = (
+            coef["caE"][a:b, 1:je, 1:ke] * E["x"][a:b, 1:je, 1:ke]
+        ) + coef["cbE"][a:b, 1:je, 1:ke] * (
+            H["z"][a:b, 1:je, 1:ke]
+            - H["z"][a:b, : je - 1, 1:ke]
+            + H["y"][a:b, 1:je, : ke - 1]
+            - H["y"][a:b, 1:je, 1:ke]
+        )
+
+    a, b = max(x0, 1) - off, min(x1, ie) - off
+    if b > a:
+        E["y"][a:b, :je, 1:ke] = (
+            coef["caE"][a:b, :je, 1:ke] * E["y"][a:b, :je, 1:ke]
+        ) + coef["cbE"][a:b, :je, 1:ke] * (
+            H["x"][a:b, :je, 1:ke]
+            - H["x"][a:b, :je, : ke - 1]
+            + H["z"][a - 1 : b - 1, :je, 1:ke]
+            - H["z"][a:b, :je, 1:ke]
+        )
+
+        E["z"][a:b, 1:je, :ke] = (
+            coef["caE"][a:b, 1:je, :ke] * E["z"][a:b, 1:je, :ke]
+        ) + coef["cbE"][a:b, 1:je, :ke] * (
+            H["x"][a:b, : je - 1, :ke]
+            - H["x"][a:b, 1:je, :ke]
+            + H["y"][a:b, 1:je, :ke]
+            - H["y"][a - 1 : b - 1, 1:je, :ke]
+        )
+
+
+def update_H(E, H, coef, shape, xr=None, off=0):
+    """Update H fields using FDTD equations. Arguments as in `update_E`."""
+    ie, je, ke = shape
+    jb, kb = (je + 1, ke + 1)
+    x0, x1 = (0, ie + 1) if xr is None else xr
+
+    a, b = max(x0, 1) - off, min(x1, ie) - off
+    if b > a:
+        H["x"][a:b, :je, :ke] = (
+            coef["daH"][a:b, :je, :ke] * H["x"][a:b, :je, :ke]
+        ) + coef["dbH"][a:b, :je, :ke] * (
+            E["y"][a:b, :je, 1:kb]
+            - E["y"][a:b, :je, :ke]
+            + E["z"][a:b, :je, :ke]
+            - E["z"][a:b, 1:jb, :ke]
+        )
+
+    a, b = max(x0, 0) - off, min(x1, ie) - off
+    if b > a:
+        H["y"][a:b, 1:je, :ke] = (
+            coef["daH"][a:b, 1:je, :ke] * H["y"][a:b, 1:je, :ke]
+        ) + coef["dbH"][a:b, 1:je, :ke] * (
+            E["x"][a:b, 1:je, :ke]
+            - E["x"][a:b, 1:je, 1:kb]
+            + E["z"][a + 1 : b + 1, 1:je, :ke]
+            - E["z"][a:b, 1:je, :ke]
+        )
+
+        H["z"][a:b, :je, 1:ke] = (
+            coef["daH"][a:b, :je, 1:ke] * H["z"][a:b, :je, 1:ke]
+        ) + coef["dbH"][a:b, :je, 1:ke] * (
+            E["x"][a:b, 1:jb, 1:ke]
+            - E["x"][a:b, :je, 1:ke]
+            + E["y"][a:b, :je, 1:ke]
+            - E["y"][a + 1 : b + 1, :je, 1:ke]
+        )
@@ -51,6 +51,13 @@ FOODSTUFF_CFG = {
     },
 }
 
+THERMAL_CFG = {
+    "potato1": {"k": 0.55, "c": 3600},
+    "potato2": {"k": 0.55, "c": 3600},
+    "burger": {"k": 0.45, "c": 3300},
+    "plate": {"k": 1.5, "c": 850},
+}
+
 
 @dataclass(eq=False)
 class CavItem:
@@ -121,6 +128,35 @@ class Grid:
     dt: float = 0
     # Location of "lower left" corner of source (source on z-y plane -> 'Side panel')
     src_corn: DimensionsRect = field(default=DimensionsRect(x=0.17, y=0.1, z=0.09))
+    # Refinement ratio of the sub-grids around the food objects (1 -> disabled)
+    subgrid_ratio: int = 1
+    subgrid_pad: int = 2  # Coarse cells of air kept around each object
+    # Timesteps advanced per tile with temporal blocking (1 -> disabled)
+    time_block: int = 1
+    tile_width: int = 4  # x-planes per tile (a plane of all arrays is ~2.6 MB)
+    # Field storage: "memory" or "mmap" (memory-mapped files, processed in slabs)
+    storage: str = "memory"
+    mmap_dir: str = field(default=None)  # Directory of the files (default: tmp)
+    slab_width: int = 32  # x-planes per slab in out-of-core runs
+    # Field layout: "dict" (one array per component) or "soa" (padded 4D buffers)
+    field_layout: str = "dict"
+
+
+@dataclass(eq=False)
+class ThermalItem:
+    k: float = 0.5  # Thermal conductivity (W/m/K)
+    c: float = 3500  # Specific heat capacity (J/kg/K)
+
+
+@dataclass(eq=False)
+class Thermal:
+    T0: float = 5.0  # Initial temperature of the objects (C)
+    T_air: float = 25.0  # Temperature of the air in the cavity (C)
+    h: float = 10.0  # Convective heat transfer coefficient at the surface (W/m^2/K)
+    safety: float = 0.9  # Fraction of the stability limit used as timestep
+    items: dict = field(
+        default_factory=lambda: {obj: ThermalItem(**v) for obj, v in THERMAL_CFG.items()}
+    )
 
 
 @dataclass
@@ -130,6 +166,7 @@ class CfgBase:
     dims: DimBase = field(default=DimBase())
     const: Constants = field(default=Constants())
     grid: Grid = field(default=Grid())
+    thermal: Thermal = field(default=Thermal())
 
 
 def make_cfg():
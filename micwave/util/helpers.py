@@ -13,8 +13,9 @@ def gpt(var):
     return int(var / cfg.grid.spacing)
 
 
-def get_coefficients(freq):
-    """Returns the ca, cb, da, db coefficients for each object"""
+def get_coefficients(freq, dt=None, spacing=None):
+    """Returns the ca, cb, da, db coefficients for each object. `dt` and
+    `spacing` default to the global grid values."""
     if freq == 915:
         coef = cfg.f915
     else:
@@ -24,23 +25,27 @@ def get_coefficients(freq):
     coeffs = defaultdict(dict)
 
     for obj in objs:
-        coeffs["ca"][obj], coeffs["cb"][obj] = cacb(obj, coef)
-        coeffs["da"][obj], coeffs["db"][obj] = dadb(obj)
+        coeffs["ca"][obj], coeffs["cb"][obj] = cacb(obj, coef, dt, spacing)
+        coeffs["da"][obj], coeffs["db"][obj] = dadb(obj, dt, spacing)
     return coeffs
 
 
-def cacb(obj, freq):
+def cacb(obj, freq, dt=None, spacing=None):
+    dt = cfg.grid.dt if dt is None else dt
+    spacing = cfg.grid.spacing if spacing is None else spacing
     obj_c = getattr(freq, obj)  # Object's frequency dependent coeffs
-    eaf = cfg.grid.dt * obj_c.sigma / (2 * cfg.const.epsz * obj_c.er)
+    eaf = dt * obj_c.sigma / (2 * cfg.const.epsz * obj_c.er)
     ca = (1 - eaf) / (1 + eaf)
-    cb = cfg.grid.dt / cfg.const.epsz / obj_c.er / cfg.grid.spacing / (1 + eaf)
+    cb = dt / cfg.const.epsz / obj_c.er / spacing / (1 + eaf)
     return (ca, cb)
 
 
-def dadb(obj):
-    haf = cfg.grid.dt * sim / (2 * cfg.const.muz * mur)
+def dadb(obj, dt=None, spacing=None):
+    dt = cfg.grid.dt if dt is None else dt
+    spacing = cfg.grid.spacing if spacing is None else spacing
+    haf = dt * sim / (2 * cfg.const.muz * mur)
     da = (1 - haf) / (1 + haf)
-    db = cfg.grid.dt / cfg.const.muz / mur / cfg.grid.spacing / (1 + haf)
+    db = dt / cfg.const.muz / mur / spacing / (1 + haf)
     return (da, db)
 
 
@@ -111,7 +116,9 @@ def print_tabular(x_headers, y_headers, text):
         print(row_format.format(obj, *row))
 
 
-def formatted_output(sar):
+def sar_table(sar):
+    """Returns the headers and the values of the SAR table, with one row per
+    object and one column per angle, followed by their mean, std and std/mean."""
     x_headers = list(sar[0.0].keys())
     y_headers = list(sar.keys())
     y_headers.extend(["μ", "σ", "σ/μ %"])
@@ -121,4 +128,8 @@ def formatted_output(sar):
     std_obj = np.std(nvals, axis=1)
     sigma_mi = 100 * std_obj / mean_sar_obj
     total_vals = np.c_[nvals, mean_sar_obj, std_obj, sigma_mi]
-    print_tabular(x_headers, y_headers, total_vals)
+    return x_headers, y_headers, total_vals
+
+
+def formatted_output(sar):
+    print_tabular(*sar_table(sar))
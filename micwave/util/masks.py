@@ -53,3 +53,36 @@ def obj_indices(grid_pts):
     """Takes a list of grid points as input and returns a tuple of
     arrays that contain the (row, col, aisles), used for indexing"""
     return tuple(grid_pts[:, i] for i in range(3))
+
+
+def refined_mask(obj, rect, box, ratio):
+    """Returns the mask of an object on a grid refined by `ratio` over the
+    coarse `box`. For `ratio=1` it reproduces the coarse mask placed at `rect`.
+    args:
+      - obj -> DimensionsSpher: Dimensions of the object.
+      - rect -> tuple: Slices of the rectangle of the object on the coarse grid.
+      - box -> tuple: Slices of the coarse grid covered by the refined grid.
+      - ratio -> int: Refinement ratio"""
+    r = gpt(obj.r)
+    # Fine cell centers in coarse grid units, relative to the object rectangle
+    X, Y, Z = (
+        (
+            box[i].start
+            + (np.arange(ratio * (box[i].stop - box[i].start)) + 0.5) / ratio
+            - 0.5
+            - rect[i].start
+        ).reshape([-1 if j == i else 1 for j in range(3)])
+        for i in range(3)
+    )
+    X, Y = X - r, Y - r
+    in_rect = (X >= -r - 0.5) & (X < r - 0.5) & (Y >= -r - 0.5) & (Y < r - 0.5)
+    if obj.z is not None:
+        # Cylindrical object
+        h = rect[2].stop - rect[2].start
+        in_rect = in_rect & (Z >= -0.5) & (Z < h - 0.5)
+        return in_rect & (np.sqrt(X ** 2 + Y ** 2) <= r)
+    else:
+        # Spherical object
+        Z = Z - r
+        in_rect = in_rect & (Z >= -r - 0.5) & (Z < r - 0.5)
+        return in_rect & (np.sqrt(X ** 2 + Y ** 2 + Z ** 2) <= r)
@@ -14,6 +14,7 @@ setup(
     entry_points={
         "console_scripts": [
             "mic=micwave.src.main:run",
+            "mic-jobs=micwave.src.jobs:main",
         ]
     },
     extras_require=extra_reqs,
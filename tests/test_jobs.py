@@ -0,0 +1,111 @@
+import asyncio
+import json
+import threading
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+
+from micwave.src.jobs import JobServer, Scenario
+
+SAR = {0.0: {"burger": 1.0, "potato": 2.0}, 90.0: {"burger": 3.0, "potato": 2.0}}
+
+
+def stub_runner(spec, job_id=None, progress=None):
+    """Stands in for `run_scenario`: reports one progress event and returns a
+    fixed SAR, or fails for 2450 MHz."""
+    if progress is not None:
+        progress.put({"event": "progress", "job": job_id, "angle": 0.0, "step": 1})
+    if spec.freq == 2450:
+        raise RuntimeError("boom")
+    return SAR
+
+
+class JobServerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.release = threading.Event()
+        self.server = JobServer(1, ThreadPoolExecutor(1), stub_runner)
+        await self.server.start()
+
+    async def asyncTearDown(self):
+        self.release.set()
+        await self.server.stop()
+
+    def blocking_runner(self, spec, job_id=None, progress=None):
+        self.release.wait(5)
+        return stub_runner(spec, job_id, progress)
+
+    async def test_result(self):
+        job_id = self.server.submit({"freq": 915, "rotations": 2})
+        info = await asyncio.wait_for(self.server.result(job_id), 5)
+        self.assertEqual(info["status"], "done")
+        self.assertEqual(info["table"]["objects"], ["burger", "potato"])
+        self.assertEqual(info["table"]["values"][0][:2], [1.0, 3.0])
+        # The σ/μ of a zero SAR is sent as null
+        self.server.jobs[job_id].sar = {0.0: {"burger": 0.0}}
+        json.loads(json.dumps(self.server.status(job_id), allow_nan=False))
+
+    async def test_watch(self):
+        job_id = self.server.submit(Scenario())
+        events = []
+        async for event in self.server.watch(job_id):
+            events.append(event["event"])
+        self.assertEqual(events[0], "running")
+        self.assertEqual(events[-1], "done")
+
+    async def test_failure(self):
+        job_id = self.server.submit({"freq": 2450})
+        with self.assertRaises(RuntimeError):
+            await asyncio.wait_for(self.server.result(job_id), 5)
+        self.assertEqual(self.server.status(job_id)["status"], "failed")
+        # The dispatcher keeps serving jobs
+        job_id = self.server.submit({})
+        info = await asyncio.wait_for(self.server.result(job_id), 5)
+        self.assertEqual(info["status"], "done")
+
+    async def test_untabulated_result(self):
+        self.server.runner = lambda spec, job_id, progress: {}
+        job_id = self.server.submit({})
+        with self.assertRaises(RuntimeError):
+            await asyncio.wait_for(self.server.result(job_id), 5)
+        self.assertEqual(self.server.status(job_id)["status"], "failed")
+
+    async def test_cancel(self):
+        self.server.runner = self.blocking_runner
+        running = self.server.submit({})
+        queued = self.server.submit({})
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.server.status(running)["status"], "running")
+        self.assertTrue(self.server.cancel(queued))
+        self.assertFalse(self.server.cancel(running))
+        with self.assertRaises(RuntimeError):
+            await asyncio.wait_for(self.server.result(queued), 5)
+        self.release.set()
+        info = await asyncio.wait_for(self.server.result(running), 5)
+        self.assertEqual(info["status"], "done")
+        self.assertEqual(self.server.status(queued)["status"], "cancelled")
+
+    async def test_stop(self):
+        self.server.runner = self.blocking_runner
+        running = self.server.submit({})
+        queued = self.server.submit({})
+        await asyncio.sleep(0.1)
+        stopping = asyncio.ensure_future(self.server.stop())
+        await asyncio.sleep(0.1)
+        # The loop is free while the running job ends
+        self.assertFalse(stopping.done())
+        for job_id in [running, queued]:
+            self.assertEqual(self.server.status(job_id)["status"], "cancelled")
+            with self.assertRaises(RuntimeError):
+                await asyncio.wait_for(self.server.result(job_id), 5)
+        self.release.set()
+        await asyncio.wait_for(stopping, 5)
+
+    def test_invalid_spec(self):
+        for spec in [{"rotations": 0}, {"freq": 1000}, {"spacing": 0}, {"x": 1}]:
+            with self.assertRaises((ValueError, TypeError)):
+                self.server.submit(spec)
+        self.assertFalse(self.server.jobs)
+
+
+if __name__ == "__main__":
+    unittest.main()
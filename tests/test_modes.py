@@ -0,0 +1,82 @@
+import copy
+import unittest
+
+import numpy as np
+
+from micwave.src.decomp import DistributedOven
+from micwave.src.microwave_oven import MicrowaveOven
+from micwave.util.config import COURANT, cfg
+
+SPACING = 0.005  # Small grid, (34, 34, 30) cells
+STEPS = 830  # Past the 800 timesteps after which max E is tracked
+
+
+class ShortOven(MicrowaveOven):
+    timesteps = STEPS
+
+
+def run(workers=1, **grid):
+    """Runs a short simulation with the `cfg.grid` overrides in `grid`."""
+    for name, value in grid.items():
+        setattr(cfg.grid, name, value)
+    oven = ShortOven(915)
+    if workers > 1:
+        DistributedOven(oven, workers).run()
+    else:
+        for _ in oven.iter_steps(every=STEPS):
+            pass
+    return oven
+
+
+class ModesTest(unittest.TestCase):
+    """The optimized modes (temporal blocking, out-of-core storage, soa
+    layout, distributed runs) must give the results of the plain loop,
+    bit for bit."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.grid = copy.deepcopy(cfg.grid)
+        cfg.grid.spacing = SPACING
+        cfg.grid.dt = COURANT * SPACING / cfg.const.c
+        cls.reference = run()
+        cfg.grid = copy.deepcopy(cls.grid)
+
+    @classmethod
+    def tearDownClass(cls):
+        cfg.grid = cls.grid
+
+    def setUp(self):
+        cfg.grid.spacing = SPACING
+        cfg.grid.dt = COURANT * SPACING / cfg.const.c
+
+    def tearDown(self):
+        cfg.grid = copy.deepcopy(self.grid)
+
+    def assertSame(self, oven):
+        ref = self.reference
+        self.assertGreater(max(v.max() for v in ref.max_E.values()), 0)
+        for field in ["E", "H", "max_E"]:
+            for k, v in getattr(ref, field).items():
+                np.testing.assert_array_equal(getattr(oven, field)[k], v)
+        self.assertEqual(oven.sar, ref.sar)
+
+    def test_time_block(self):
+        for block in [2, 3, 5]:
+            with self.subTest(block=block):
+                self.assertSame(run(time_block=block))
+
+    def test_mmap(self):
+        self.assertSame(run(storage="mmap", slab_width=8))
+
+    def test_soa(self):
+        self.assertSame(run(field_layout="soa"))
+
+    def test_workers(self):
+        for workers in [2, 3]:
+            with self.subTest(workers=workers):
+                self.assertSame(run(workers))
+        self.assertSame(run(2, field_layout="soa"))
+
+
+if __name__ == "__main__":
+    unittest.main()